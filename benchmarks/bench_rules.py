@@ -0,0 +1,237 @@
+"""Micro-benchmarks for the mahjong_rules functions that run on every draw, discard and claim.
+
+Usage: python -m benchmarks.bench_rules [--hands N] [--repeat N] [--min-time S] [--seed N] [--filter TEXT]
+                                        [--corpus CORPUS]
+                                        [--out results.json] [--baseline baseline.json] [--threshold 0.2]
+
+Hands are generated with tests/util.py's TileSampler from a fixed seed, so every run times the same inputs. Each case
+calls one function on every hand of a corpus, as many times over as fit in --min-time. The best of --repeat passes is
+reported as ops/sec, one more pass under tracemalloc reports the peak memory allocated by a pass. --out saves the
+results as JSON, --baseline compares against a saved file and exits with status 1 if any case got slower by more
+than --threshold. --corpus adds cases for a sample of --hands records from a winning hand corpus written by
+benchmarks/hand_corpus.py.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+# tests.context imports server, which imports tests.util, so it has to come first
+import tests.context
+from tests.util import TileSampler
+import mahjong_rules
+from benchmarks import hand_corpus
+from tile_groups import numeric
+
+MELD_TYPES = ['PUNG', 'CHOW', 'KONG', 'WIN']
+
+##### Corpora #####
+
+def winning_hand():
+    sampler = TileSampler()
+    hand = []
+    for _ in range(4):
+        hand += sampler.pong() if random.random() < 0.5 else sampler.chow()
+    return hand + sampler.pair()
+
+def tenpai_hand():
+    """A winning hand with one tile taken out, 13 tiles"""
+    hand = winning_hand()
+    hand.pop(random.randrange(len(hand)))
+    return hand
+
+def random_hand(n=14):
+    return TileSampler().rand_tile(n)
+
+def kong_hand():
+    sampler = TileSampler()
+    return sampler.kong() + sampler.rand_tile(10)
+
+def single_suit_hand(types):
+    suit = random.choice(numeric)['suit']
+    return [{ 'suit': suit, 'type': t } for t in types]
+
+# Single suit hands with the most ways to split into melds, the backtracking in get_melds and
+# can_meld_concealed_hand does the most work on these
+WORST_CASE_TYPES = [
+    [1, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4, 5, 5],
+    [1, 1, 1, 2, 3, 4, 5, 5, 6, 7, 8, 9, 9, 9],
+    [2, 2, 2, 3, 3, 3, 4, 4, 4, 5, 5, 5, 6, 6],
+    [1, 2, 2, 3, 3, 3, 4, 4, 4, 5, 5, 6, 7, 7],
+]
+
+def worst_case_hand():
+    return single_suit_hand(random.choice(WORST_CASE_TYPES))
+
+def get_corpora(num_of_hands, seed):
+    random.seed(seed)
+    corpora = {
+        'winning': [winning_hand() for _ in range(num_of_hands)],
+        'tenpai': [tenpai_hand() for _ in range(num_of_hands)],
+        'random': [random_hand() for _ in range(num_of_hands)],
+        'kong': [kong_hand() for _ in range(num_of_hands)],
+        'worst_case': [worst_case_hand() for _ in range(num_of_hands)],
+    }
+    # Discards to claim with the 13 tile hands, and meld types to claim them as
+    corpora['discards'] = [TileSampler().rand_tile()[0] for _ in range(num_of_hands)]
+    corpora['numeric_discards'] = [single_suit_hand([random.randint(1, 9)])[0] for _ in range(num_of_hands)]
+    corpora['meld_types'] = [random.choice(MELD_TYPES) for _ in range(num_of_hands)]
+    return corpora
+
+def sample_corpus(path, num_of_hands):
+    """Reservoir sample of hands from a corpus file, as tile dicts"""
+    sample = []
+    for n, (counts, _) in enumerate(hand_corpus.iter_corpus(path)):
+        if n < num_of_hands:
+            sample.append(counts)
+        else:
+            idx = random.randrange(n + 1)
+            if idx < num_of_hands:
+                sample[idx] = counts
+    return [hand_corpus.to_tiles(counts) for counts in sample]
+
+def get_cases(corpora):
+    """Returns (name, func, list of args tuples) for every benchmark case"""
+    c = corpora
+    # A drawn tile on top of a tenpai hand, mostly not winning but close to it
+    tenpai_plus_draw = [hand + [tile] for hand, tile in zip(c['tenpai'], c['discards'])]
+    cases = [
+        ('can_meld_concealed_hand/winning', mahjong_rules.can_meld_concealed_hand, [(h,) for h in c['winning']]),
+        ('can_meld_concealed_hand/tenpai', mahjong_rules.can_meld_concealed_hand, [(h,) for h in tenpai_plus_draw]),
+        ('can_meld_concealed_hand/random', mahjong_rules.can_meld_concealed_hand, [(h,) for h in c['random']]),
+        ('can_meld_concealed_hand/worst_case', mahjong_rules.can_meld_concealed_hand, [(h,) for h in c['worst_case']]),
+        ('get_melds/winning', mahjong_rules.get_melds, [(h, 0) for h in c['winning']]),
+        ('get_melds/worst_case', mahjong_rules.get_melds, [(h, 0) for h in c['worst_case']]),
+        ('check_tiles_against_meld/tenpai', mahjong_rules.check_tiles_against_meld,
+            [(h, d, m, 0) for h, d, m in zip(c['tenpai'], c['discards'], c['meld_types'])]),
+        ('check_tiles_against_meld/random', mahjong_rules.check_tiles_against_meld,
+            [(h[:13], d, m, 0) for h, d, m in zip(c['random'], c['discards'], c['meld_types'])]),
+        ('get_valid_chow_subsets/tenpai', mahjong_rules.get_valid_chow_subsets, list(zip(c['tenpai'], c['numeric_discards']))),
+        ('get_valid_chow_subsets/random', mahjong_rules.get_valid_chow_subsets, [(h[:13], d) for h, d in zip(c['random'], c['numeric_discards'])]),
+        ('get_tile_for_kong/kong', mahjong_rules.get_tile_for_kong, [(h,) for h in c['kong']]),
+        ('get_tile_for_kong/random', mahjong_rules.get_tile_for_kong, [(h,) for h in c['random']]),
+    ]
+    if 'corpus' in c:
+        cases += [
+            ('can_meld_concealed_hand/corpus', mahjong_rules.can_meld_concealed_hand, [(h,) for h in c['corpus']]),
+            ('get_melds/corpus', mahjong_rules.get_melds, [(h, 0) for h in c['corpus']]),
+        ]
+    return cases
+
+##### Running and comparing #####
+
+def run_pass(func, args_list, loops=1):
+    start = time.perf_counter()
+    for _ in range(loops):
+        for args in args_list:
+            func(*args)
+    return time.perf_counter() - start
+
+def get_loops(func, args_list, min_time):
+    """Number of times to go over the corpus per pass so a pass takes at least min_time, like timeit's autorange"""
+    loops = 1
+    while True:
+        if run_pass(func, args_list, loops) >= min_time:
+            return loops
+        loops *= 2
+
+def run_case(func, args_list, repeat, min_time):
+    loops = get_loops(func, args_list, min_time)
+    best = min(run_pass(func, args_list, loops) for _ in range(repeat)) / loops
+
+    tracemalloc.start()
+    run_pass(func, args_list)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'calls': len(args_list),
+        'ops_per_s': round(len(args_list) / best, 1),
+        'us_per_op': round(best / len(args_list) * 1e6, 3),
+        'peak_alloc_bytes': peak_bytes,
+    }
+
+def get_environment():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'date': f"{datetime.utcnow().isoformat(timespec='seconds')}Z",
+    }
+
+def compare(results, baseline, threshold):
+    """Prints each case's ops/sec against the baseline, returns the names of cases slower by more than threshold"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f'{name:<45} {result["ops_per_s"]:>12.1f} ops/s   (not in baseline)')
+            continue
+        ratio = result['ops_per_s'] / base['ops_per_s']
+        flag = ''
+        if ratio < 1 - threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:<45} {result["ops_per_s"]:>12.1f} ops/s   {ratio:6.2f}x baseline{flag}')
+    return regressions
+
+def add_arguments(parser):
+    """Arguments shared by the benchmarks in this package"""
+    parser.add_argument('--repeat', type=int, default=5, help='passes per case, the fastest one is reported')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per pass')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--filter', default='', help='only run cases whose name contains this')
+    parser.add_argument('--out', help='save results to this JSON file')
+    parser.add_argument('--baseline', help='compare against results saved with --out')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown that counts as a regression')
+
+def report(args, results):
+    """Prints results, saves them and compares them with the baseline as asked for in args, returns the exit status"""
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({ 'environment': get_environment(), 'results': results }, f, indent=2)
+        print(f'Saved results to {args.out}')
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f'{len(regressions)} case(s) regressed by more than {args.threshold:.0%}: {", ".join(regressions)}')
+        return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark mahjong_rules hot functions')
+    parser.add_argument('--hands', type=int, default=200, help='hands per corpus')
+    parser.add_argument('--corpus', help='winning hand corpus written by benchmarks/hand_corpus.py')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    corpora = get_corpora(args.hands, args.seed)
+    if args.corpus:
+        corpora['corpus'] = sample_corpus(args.corpus, args.hands)
+
+    results = {}
+    for name, func, args_list in get_cases(corpora):
+        if args.filter not in name:
+            continue
+        # get_melds prints its search, keep it out of the output
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            result = run_case(func, args_list, args.repeat, args.min_time)
+        results[name] = result
+        if not args.baseline:
+            print(f'{name:<45} {result["ops_per_s"]:>12.1f} ops/s {result["us_per_op"]:>10.2f}us/op {result["peak_alloc_bytes"]:>10} peak bytes')
+
+    sys.exit(report(args, results))
+
+if __name__ == '__main__':
+    main()
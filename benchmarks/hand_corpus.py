@@ -0,0 +1,193 @@
+"""Enumerates every standard winning hand (four sets and a pair, no bonus tiles) as a corpus of compact records.
+
+Usage: python -m benchmarks.hand_corpus OUT [--workers N] [--shard I/N] [--batch-size N]
+       python -m benchmarks.hand_corpus --check CORPUS [--limit N]
+
+A hand is a pattern of tile counts for each of the three suits times a pattern for the honors. Suits are
+interchangeable for win detection, so each record is one shape with its suit patterns in canonical order, plus the
+number of distinct hands it stands for by assigning the patterns to suits. The multiplicities add up to the
+11,498,658 distinct winning hands. A record is a line of 34 tile counts (bamboo, character and dots 1-9, then the
+honors in TILE_KEYS order) followed by the multiplicity, e.g. '1112345678999000000000000000000000 1'.
+
+Records are generated per task, tasks can be split into shards (--shard 0/4 writes the first of four) and run in
+worker processes (--workers), output is written in batches. --check verifies a corpus with can_meld_concealed_hand,
+the golden check for any faster win detection.
+"""
+import argparse
+import contextlib
+import functools
+import os
+import itertools
+import sys
+import time
+from multiprocessing import Pool
+
+import mahjong_rules
+from tiles import TILE_KEYS, INDEX_BY_KEY, NUM_OF_TILE_KINDS
+
+SUIT_SIZE = 9
+SUITS = ['bamboo', 'character', 'dots']
+HONOR_KEYS = [key for key in TILE_KEYS if key[0] in ('dragon', 'wind')]
+CORPUS_KEYS = [(suit, t) for suit in SUITS for t in range(1, SUIT_SIZE + 1)] + HONOR_KEYS
+# Position in the server's tile index counts of every corpus count
+CORPUS_INDICES = [INDEX_BY_KEY[key] for key in CORPUS_KEYS]
+
+SETS_IN_HAND = 4
+
+@functools.lru_cache(maxsize=None)
+def get_suit_patterns():
+    """Returns a dict of (num_of_sets, num_of_pairs) to the sorted count patterns of a single suit made of them"""
+    pungs = [tuple(3 if i == t else 0 for i in range(SUIT_SIZE)) for t in range(SUIT_SIZE)]
+    chows = [tuple(1 if t <= i < t + 3 else 0 for i in range(SUIT_SIZE)) for t in range(SUIT_SIZE - 2)]
+    sets = pungs + chows
+    pairs = [tuple(2 if i == t else 0 for i in range(SUIT_SIZE)) for t in range(SUIT_SIZE)]
+
+    patterns_by_class = {}
+    for num_of_pairs, starts in ((0, [(0,) * SUIT_SIZE]), (1, pairs)):
+        # Sets are added in non-decreasing order, (pattern, index of the last set) pairs
+        level = {(pattern, 0) for pattern in starts}
+        patterns_by_class[(0, num_of_pairs)] = sorted(starts)
+        for num_of_sets in range(1, SETS_IN_HAND + 1):
+            level = {
+                (new_pattern, s)
+                for pattern, lo in level
+                for s in range(lo, len(sets))
+                for new_pattern in [tuple(a + b for a, b in zip(pattern, sets[s]))]
+                if max(new_pattern) <= 4
+            }
+            patterns_by_class[(num_of_sets, num_of_pairs)] = sorted({pattern for pattern, _ in level})
+    return patterns_by_class
+
+@functools.lru_cache(maxsize=None)
+def get_honor_patterns(num_of_pungs, num_of_pairs):
+    patterns = []
+    for pung_idxs in itertools.combinations(range(len(HONOR_KEYS)), num_of_pungs):
+        for pair_idxs in itertools.combinations([i for i in range(len(HONOR_KEYS)) if i not in pung_idxs], num_of_pairs):
+            patterns.append(tuple(3 if i in pung_idxs else 2 if i in pair_idxs else 0 for i in range(len(HONOR_KEYS))))
+    return patterns
+
+@functools.lru_cache(maxsize=None)
+def get_tasks():
+    """Returns (suit classes, honor class, index of the first suit's pattern) for every unit of work. Suit classes are
+       in non-increasing order, so each multiset of suit patterns is generated once."""
+    classes = sorted(get_suit_patterns())
+    tasks = []
+    for c1, c2, c3 in itertools.combinations_with_replacement(reversed(classes), 3):
+        num_of_pungs = SETS_IN_HAND - c1[0] - c2[0] - c3[0]
+        num_of_pairs = 1 - c1[1] - c2[1] - c3[1]
+        if num_of_pungs < 0 or num_of_pairs < 0 or num_of_pungs + num_of_pairs > len(HONOR_KEYS):
+            continue
+        for i in range(len(get_suit_patterns()[c1])):
+            tasks.append(((c1, c2, c3), (num_of_pungs, num_of_pairs), i))
+    return tasks
+
+def get_suit_multiplicity(a, b, c):
+    """Number of distinct ways to assign three suit patterns to the three suits"""
+    if a == b == c:
+        return 1
+    if a == b or b == c or a == c:
+        return 3
+    return 6
+
+def iter_task(task):
+    """Yields (counts, multiplicity) for every shape of the task"""
+    (c1, c2, c3), honor_class, i = task
+    patterns_by_class = get_suit_patterns()
+    honor_patterns = get_honor_patterns(*honor_class)
+
+    a = patterns_by_class[c1][i]
+    # Within a class patterns are taken in non-decreasing index order
+    second = patterns_by_class[c2][i if c2 == c1 else 0:]
+    for j, b in enumerate(second):
+        third_start = (i if c2 == c1 else 0) + j if c3 == c2 else 0
+        for c in patterns_by_class[c3][third_start:]:
+            multiplicity = get_suit_multiplicity(a, b, c)
+            suits = a + b + c
+            for honors in honor_patterns:
+                yield suits + honors, multiplicity
+
+def iter_shapes(shard=0, num_of_shards=1):
+    for task in get_tasks()[shard::num_of_shards]:
+        yield from iter_task(task)
+
+def encode(counts, multiplicity):
+    return f"{''.join(map(str, counts))} {multiplicity}\n"
+
+def decode(line):
+    counts, multiplicity = line.split()
+    return [int(c) for c in counts], int(multiplicity)
+
+def to_index_counts(counts):
+    """Converts corpus counts to the server's tile index counts, as taken by mahjong_rules.can_win_with_counts"""
+    index_counts = [0] * NUM_OF_TILE_KINDS
+    for idx, count in zip(CORPUS_INDICES, counts):
+        index_counts[idx] = count
+    return index_counts
+
+def to_tiles(counts):
+    """Converts corpus counts to a list of tile dicts, as taken by mahjong_rules.can_meld_concealed_hand"""
+    return [{ 'suit': key[0], 'type': key[1] } for key, count in zip(CORPUS_KEYS, counts) for _ in range(count)]
+
+def iter_corpus(path, limit=None):
+    """Yields (counts, multiplicity) for the records in a corpus file"""
+    with open(path) as f:
+        for line in itertools.islice(f, limit):
+            yield decode(line)
+
+def get_task_lines(task):
+    return [encode(counts, multiplicity) for counts, multiplicity in iter_task(task)]
+
+def write_corpus(path, shard=0, num_of_shards=1, workers=1, batch_size=100000):
+    """Writes the shard's records to path, returns (number of records, number of hands they stand for)"""
+    tasks = get_tasks()[shard::num_of_shards]
+    record_count = hand_count = 0
+    batch = []
+
+    with open(path, 'w') as f, Pool(workers) as pool:
+        # imap keeps the task order, so the output doesn't depend on the number of workers
+        for lines in pool.imap(get_task_lines, tasks, chunksize=16):
+            batch += lines
+            record_count += len(lines)
+            hand_count += sum(int(line[line.index(' ') + 1:]) for line in lines)
+            if len(batch) >= batch_size:
+                f.writelines(batch)
+                batch = []
+        f.writelines(batch)
+    return record_count, hand_count
+
+def check_corpus(path, limit=None):
+    """Returns the records of a corpus that can_meld_concealed_hand doesn't accept as winning hands"""
+    # can_meld_concealed_hand prints its search, keep it out of the output
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return [
+            (counts, multiplicity)
+            for counts, multiplicity in iter_corpus(path, limit)
+            if not mahjong_rules.can_meld_concealed_hand(to_tiles(counts))
+        ]
+
+def main():
+    parser = argparse.ArgumentParser(description='Enumerate every standard winning hand shape')
+    parser.add_argument('out', nargs='?')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--shard', default='0/1', help='I/N writes the I-th of N shards')
+    parser.add_argument('--batch-size', type=int, default=100000, help='records per write')
+    parser.add_argument('--check', metavar='CORPUS', help='verify a corpus with can_meld_concealed_hand')
+    parser.add_argument('--limit', type=int, help='number of records to check')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.check:
+        failures = check_corpus(args.check, args.limit)
+        for counts, _ in failures[:10]:
+            print(f'Not a winning hand according to can_meld_concealed_hand: {"".join(map(str, counts))}')
+        print(f'Checked {args.check} in {time.perf_counter() - start:.1f}s, {len(failures)} failure(s)')
+        sys.exit(1 if failures else 0)
+
+    if not args.out:
+        parser.error('an output file is required')
+    shard, num_of_shards = map(int, args.shard.split('/'))
+    record_count, hand_count = write_corpus(args.out, shard, num_of_shards, args.workers, args.batch_size)
+    print(f'Wrote {record_count} shapes standing for {hand_count} hands to {args.out} in {time.perf_counter() - start:.1f}s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+"""Load test that plays complete games against a running server with simulated Socket.IO players.
+
+Usage: python -m benchmarks.load_test [--url URL] [--tables N] [--processes N] [--ramp S] [--duration S]
+                                      [--think-ms MS] [--claim-rate P] [--game-timeout S] [--report-interval S]
+                                      [--out results.json]
+
+Every table is four clients that go through the same events as the web client: 'ready', 'enter_game' (the host
+creates the room, the others join it), 'start_game', then 'draw_tile', 'end_turn', 'update_claim_state',
+'complete_new_meld' and 'declare_win' as the server asks for them, each after a random think time averaging
+--think-ms. Players discard a random tile, claim a PUNG when they hold two of the discard with probability
+--claim-rate and declare a win as soon as they can. Tables start evenly over --ramp seconds and play games back
+to back, with new clients for every game, until --duration seconds have passed.
+
+Every event is sent with an ack callback, its latency is the time until the server's ack arrives, which includes
+the time the event waited for the hub and the time its handler ran. The report has the connections that were
+made and failed, events per second, p50/p95/p99 latency for each event and the games finished or timed out.
+Raise --tables until latencies climb or games time out to find how many tables a worker sustains.
+
+The clients use the websocket transport when websocket-client is installed and long-polling otherwise, which costs
+the load generator a lot more CPU per player. A single process runs out of CPU long before the server does with
+thousands of players, --processes spreads the tables over several processes and merges their results.
+"""
+import eventlet
+import eventlet.event
+# Clients run on green threads, sockets and threads have to be patched before socketio is imported
+eventlet.monkey_patch()
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import socketio
+
+NUM_OF_SEATS = 4
+FINAL_STATES = ('WIN', 'LOSS', 'DRAW')
+
+class LoadStats:
+    def __init__(self):
+        self.latencies_by_event = defaultdict(list)
+        self.sent_count = 0
+        self.received_count = 0
+        self.connect_times = []
+        self.connect_failed_count = 0
+        self.connected_count = 0
+        self.peak_connected_count = 0
+        self.outcome_count = Counter()
+        self.game_timed_out_count = 0
+        self.game_times = []
+
+    def connected(self, seconds):
+        self.connect_times.append(seconds)
+        self.connected_count += 1
+        self.peak_connected_count = max(self.peak_connected_count, self.connected_count)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(vars(self), f)
+
+    def merge(self, path):
+        """Adds the stats another process saved to path, peak connections add up as if every process peaked at once"""
+        with open(path) as f:
+            other = json.load(f)
+        for event, latencies in other['latencies_by_event'].items():
+            self.latencies_by_event[event] += latencies
+        for name in ('sent_count', 'received_count', 'connect_failed_count', 'connected_count', 'peak_connected_count', 'game_timed_out_count'):
+            setattr(self, name, getattr(self, name) + other[name])
+        self.connect_times += other['connect_times']
+        self.game_times += other['game_times']
+        self.outcome_count.update(other['outcome_count'])
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))]
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2) if values else 0,
+    }
+
+class SimulatedPlayer:
+    """One Socket.IO client, keeps track of its own concealed tiles from the events the server sends it"""
+    def __init__(self, table, seat):
+        self.table = table
+        self.stats = table.stats
+        self.args = table.args
+        self.is_host = seat == 0
+        self.username = f'load-{table.idx}-{seat}'
+        self.player_uuid = uuid.uuid4().hex
+        self.tiles = []
+        self.can_declare_win = False
+        self.discarded_tile = None
+
+        self.sio = socketio.Client(reconnection=False)
+        for event, handler in [
+            ('update_room_id', self.update_room_id),
+            ('update_tiles', self.update_tiles),
+            ('extend_tiles', self.extend_tiles),
+            ('update_can_declare_win', self.update_can_declare_win),
+            ('update_discarded_tile', self.update_discarded_tile),
+            ('update_current_state', self.update_current_state),
+            ('declare_claim_with_timer', self.declare_claim_with_timer),
+            ('valid_tile_sets_for_meld', self.valid_tile_sets_for_meld),
+        ]:
+            self.sio.on(event, self.counted(handler))
+
+    def counted(self, handler):
+        def wrapper(*args):
+            self.stats.received_count += 1
+            handler(*args)
+        return wrapper
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            self.sio.connect(self.args.url)
+        except socketio.exceptions.ConnectionError:
+            self.stats.connect_failed_count += 1
+            return False
+        self.stats.connected(time.perf_counter() - start)
+        eventlet.spawn(self.send_heartbeats)
+        return True
+
+    def disconnect(self):
+        if self.sio.connected:
+            self.sio.disconnect()
+            self.stats.connected_count -= 1
+
+    def send_heartbeats(self):
+        # The server hands the seats of players it stops hearing from to its bot
+        while self.sio.connected:
+            self.emit('heartbeat')
+            eventlet.sleep(self.args.heartbeat_s)
+
+    def emit(self, event, data=None):
+        start = time.perf_counter()
+
+        def ack(*args):
+            self.stats.latencies_by_event[event].append(time.perf_counter() - start)
+
+        self.stats.sent_count += 1
+        self.sio.emit(event, data, callback=ack)
+
+    def act(self, event, data=None):
+        """Emits the event after a think time, without holding up the client's event loop"""
+        think_s = random.uniform(0, 2 * self.args.think_ms / 1000)
+        eventlet.spawn_after(think_s, self.emit, event, data)
+
+    def enter_game(self, room_id=None):
+        self.emit('ready', { 'player-uuid': self.player_uuid })
+        self.emit('enter_game', {
+            'username': self.username,
+            'player_uuid': self.player_uuid,
+            'room_id': room_id,
+            'should_create_room': self.is_host,
+        })
+
+    ##### Server events #####
+
+    def update_room_id(self, room_id):
+        self.table.joined(self, room_id)
+
+    def update_tiles(self, tiles):
+        self.tiles = tiles
+
+    def extend_tiles(self, tile):
+        self.tiles.append(tile)
+
+    def update_can_declare_win(self, can_declare_win):
+        self.can_declare_win = can_declare_win
+
+    def update_discarded_tile(self, tile=None):
+        # A claimed discard is cleared with an event without data
+        self.discarded_tile = tile
+
+    def update_current_state(self, state):
+        if state == 'DRAW_TILE':
+            self.act('draw_tile')
+        elif state == 'DISCARD_TILE':
+            if self.can_declare_win:
+                self.act('declare_win')
+                return
+            tile = self.tiles.pop(random.randrange(len(self.tiles)))
+            self.act('end_turn', { 'discarded_tile': tile })
+        elif state in FINAL_STATES:
+            self.table.ended(state)
+
+    def declare_claim_with_timer(self, payload):
+        declared_meld = None
+        if self.discarded_tile is not None and self.tiles.count(self.discarded_tile) >= 2 and random.random() < self.args.claim_rate:
+            declared_meld = 'PUNG'
+        self.act('update_claim_state', { 'declared_meld': declared_meld })
+
+    def valid_tile_sets_for_meld(self, payload):
+        subset = payload['validMeldSubsets'][0]
+        for tile in subset:
+            self.tiles.remove(tile)
+        self.act('complete_new_meld', { 'new_meld': payload['newMeld'] + subset })
+
+class Table:
+    """Four simulated players that play one game after another until the deadline"""
+    def __init__(self, idx, args, stats, deadline):
+        self.idx = idx
+        self.args = args
+        self.stats = stats
+        self.deadline = deadline
+
+    def play(self):
+        while time.monotonic() < self.deadline:
+            self.play_game()
+
+    def play_game(self):
+        self.players = [SimulatedPlayer(self, seat) for seat in range(NUM_OF_SEATS)]
+        self.room_id = None
+        self.joined_players = set()
+        self.room_joined = eventlet.event.Event()
+        self.all_joined = eventlet.event.Event()
+        self.game_over = eventlet.event.Event()
+        try:
+            if not all(player.connect() for player in self.players):
+                # Back off before trying again, a worker out of connections won't recover right away
+                eventlet.sleep(1)
+                return
+
+            host, guests = self.players[0], self.players[1:]
+            host.enter_game()
+            if not self.wait(self.room_joined):
+                return
+            for player in guests:
+                player.enter_game(self.room_id)
+            if not self.wait(self.all_joined):
+                return
+
+            start = time.monotonic()
+            host.act('start_game')
+            if self.wait(self.game_over):
+                self.stats.game_times.append(time.monotonic() - start)
+        finally:
+            for player in self.players:
+                player.disconnect()
+
+    def wait(self, event):
+        with eventlet.Timeout(self.args.game_timeout, False):
+            event.wait()
+            return True
+        self.stats.game_timed_out_count += 1
+        return False
+
+    def joined(self, player, room_id):
+        if player.is_host:
+            self.room_id = room_id
+            self.room_joined.send()
+        self.joined_players.add(player.player_uuid)
+        if len(self.joined_players) == NUM_OF_SEATS and not self.all_joined.ready():
+            self.all_joined.send()
+
+    def ended(self, state):
+        # Every player gets their final state, the first one to arrive ends the table's game
+        if not self.game_over.ready():
+            self.stats.outcome_count['DRAW' if state == 'DRAW' else 'WIN'] += 1
+            self.game_over.send()
+
+def print_progress(prefix, stats, elapsed_s, last_count, interval_s):
+    received = stats.received_count
+    print(f'{prefix}{elapsed_s:6.0f}s  connected={stats.connected_count:<6} sent={stats.sent_count:<8} '
+          f'received/s={(received - last_count) / interval_s:<8.1f} games={len(stats.game_times)} '
+          f'timed_out={stats.game_timed_out_count} connect_failed={stats.connect_failed_count}')
+    return received
+
+def get_results(stats, elapsed_s):
+    return {
+        'elapsed_s': round(elapsed_s, 1),
+        'connections': {
+            'connected': len(stats.connect_times),
+            'failed': stats.connect_failed_count,
+            'peak_concurrent': stats.peak_connected_count,
+            'connect_time': summarize(stats.connect_times),
+        },
+        'events': {
+            'sent': stats.sent_count,
+            'received': stats.received_count,
+            'sent_per_s': round(stats.sent_count / elapsed_s, 1),
+            'received_per_s': round(stats.received_count / elapsed_s, 1),
+        },
+        'latency_by_event': { event: summarize(latencies) for event, latencies in sorted(stats.latencies_by_event.items()) },
+        'games': {
+            'finished': len(stats.game_times),
+            'timed_out': stats.game_timed_out_count,
+            'outcomes': dict(stats.outcome_count),
+            'game_time': summarize(stats.game_times),
+        },
+    }
+
+def print_results(results):
+    connections = results['connections']
+    print(f"Connections: {connections['connected']} made, {connections['failed']} failed, "
+          f"{connections['peak_concurrent']} at once, connect p50={connections['connect_time']['p50_ms']}ms "
+          f"p99={connections['connect_time']['p99_ms']}ms")
+    events = results['events']
+    print(f"Events: {events['sent_per_s']} sent/s, {events['received_per_s']} received/s over {results['elapsed_s']}s")
+    print(f"{'event':<22} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for event, s in results['latency_by_event'].items():
+        print(f"{event:<22} {s['count']:>8} {s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9} {s['max_ms']:>9}")
+    games = results['games']
+    print(f"Games: {games['finished']} finished {games['outcomes']}, {games['timed_out']} timed out, "
+          f"game time p50={games['game_time']['p50_ms'] / 1000:.1f}s")
+
+def run_tables(args, process_idx):
+    """Plays this process's share of the tables, returns its LoadStats"""
+    stats = LoadStats()
+    table_idxs = range(process_idx, args.tables, args.processes)
+    prefix = f'[{process_idx}] ' if args.processes > 1 else ''
+    start = time.monotonic()
+    pool = eventlet.GreenPool(len(table_idxs))
+    for idx in table_idxs:
+        pool.spawn(Table(idx, args, stats, start + args.duration).play)
+        eventlet.sleep(args.ramp / len(table_idxs))
+
+    last_count = 0
+    while pool.running():
+        eventlet.sleep(args.report_interval)
+        last_count = print_progress(prefix, stats, time.monotonic() - start, last_count, args.report_interval)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Play games against a running server with simulated players')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--tables', type=int, default=10, help='concurrent games, four clients each')
+    parser.add_argument('--processes', type=int, default=1, help='processes to spread the clients over')
+    parser.add_argument('--ramp', type=float, default=10, help='seconds over which tables start')
+    parser.add_argument('--duration', type=float, default=60, help='seconds after which no new games start')
+    parser.add_argument('--think-ms', type=float, default=300, help='average delay before each action')
+    parser.add_argument('--claim-rate', type=float, default=0.5, help='probability of claiming a possible PUNG')
+    parser.add_argument('--heartbeat-s', type=float, default=10)
+    parser.add_argument('--game-timeout', type=float, default=300, help='seconds before a game counts as stuck')
+    parser.add_argument('--report-interval', type=float, default=5, help='seconds between progress lines')
+    parser.add_argument('--out', help='save results to this JSON file')
+    # Set on the processes started for --processes
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--worker-out', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.processes = max(1, min(args.processes, args.tables))
+
+    if args.worker is not None:
+        run_tables(args, args.worker).save(args.worker_out)
+        return
+
+    start = time.monotonic()
+    if args.processes == 1:
+        stats = run_tables(args, 0)
+    else:
+        stats = LoadStats()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [os.path.join(tmp_dir, f'{idx}.json') for idx in range(args.processes)]
+            workers = [
+                subprocess.Popen([sys.executable, '-m', 'benchmarks.load_test', *sys.argv[1:], '--worker', str(idx), '--worker-out', path])
+                for idx, path in enumerate(paths)
+            ]
+            for worker, path in zip(workers, paths):
+                if worker.wait() == 0:
+                    stats.merge(path)
+
+    results = get_results(stats, time.monotonic() - start)
+    print_results(results)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({ 'args': vars(args), 'results': results }, f, indent=2)
+        print(f'Saved results to {args.out}')
+
+    sys.exit(1 if stats.connect_failed_count or stats.game_timed_out_count else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import mahjong_rules
+from tiles import get_index_counts
+
+def get_discard(player):
+    """Picks the tile that is least useful for building melds: the tile with the fewest copies and neighbors in hand"""
+    counts = get_index_counts(player.tiles)
+
+    def usefulness(idx):
+        return 2 * counts[idx] + sum(
+            counts[a] + counts[b] for a, b in mahjong_rules.CHOW_NEIGHBORS[idx]
+        )
+
+    return min(player.tiles, key=usefulness)
+
+def get_bot_action(player):
+    """Returns the next (action, args) for a bot playing the given player, or None if it's not the player's move.
+       Actions are named like game_record.ACTIONS. The bot never claims discards, it only plays its own turns."""
+    state = player.current_state
+    if state == 'DRAW_TILE':
+        return 'draw_tile', ()
+    if state == 'DISCARD_TILE':
+        num_of_melds = len(player.revealed_melds) + len(player.concealed_kongs)
+        if mahjong_rules.can_win_with_counts(get_index_counts(player.tiles), 4 - num_of_melds):
+            return 'declare_win', ()
+        return 'end_turn', (get_discard(player),)
+    if state == 'DECLARE_CLAIM':
+        return 'update_claim_state', (None,)
+    if state == 'REVEAL_MELD':
+        # Seat was taken over after the player claimed a discard, finish the meld with the first valid tiles
+        return 'complete_new_meld', (bytes(player.new_meld) + player.valid_meld_subsets[0],)
+    return None
@@ -1,35 +1,124 @@
-from collections import defaultdict
 import random
 import string
+import time
+from collections import deque
 import server_logger
+from matchmaker import Matchmaker
+from tiles import to_tile, to_tiles, to_melds
 
 logger = server_logger.get()
 
+ROOM_ID_CHARS = string.ascii_letters + string.digits
+
+class Player:
+    """Per-player game state, tiles are stored as tile indices (see tiles.py)"""
+    __slots__ = (
+        'username',
+        'tiles',
+        'current_state',
+        'declare_claim_start_time',
+        'declared_meld_type',
+        'valid_meld_subsets',
+        'revealed_melds',
+        'new_meld',
+        'concealed_kongs',
+        'can_declare_kong',
+        'can_declare_win',
+        'claim_table',
+        'is_host',
+        'is_ai',
+    )
+
+    def __init__(self, username, is_host, is_ai):
+        self.username = username
+        self.tiles = bytearray()
+        self.current_state = 'NO_ACTION'
+        self.declare_claim_start_time = None
+        self.declared_meld_type = None
+        self.valid_meld_subsets = None
+        self.revealed_melds = []
+        self.new_meld = bytearray()
+        self.concealed_kongs = []
+        self.can_declare_kong = False
+        self.can_declare_win = False
+        self.claim_table = None
+        self.is_host = is_host
+        self.is_ai = is_ai
+
+class Room:
+    """Per-room game state, the wall is a shuffled buffer of tile indices drawn from the front using draw_idx.
+       Setting wall_seed before the game starts deals the wall generated from that seed."""
+    __slots__ = (
+        'wall',
+        'wall_seed',
+        'draw_idx',
+        'player_by_uuid',
+        'player_uuids',
+        'current_player_idx',
+        'past_discarded_tiles',
+        'current_discarded_tile',
+        'messages',
+        'claimed_player_uuids',
+        'human_player_count',
+        'is_game_in_progress',
+        'record',
+        'spectator_sids',
+        'state',
+        'last_active_at',
+    )
+
+    def __init__(self, chat_history_size=50):
+        self.wall = bytearray()
+        self.wall_seed = None
+        self.draw_idx = 0
+        self.player_by_uuid = {}
+        self.player_uuids = []
+        self.current_player_idx = 0
+        self.past_discarded_tiles = bytearray()
+        self.current_discarded_tile = None
+        # Most recent chat messages as (msg_type, msg_text) tuples, older messages are dropped
+        self.messages = deque(maxlen=chat_history_size)
+        self.claimed_player_uuids = set()
+        self.human_player_count = 0
+        self.is_game_in_progress = False
+        self.record = None
+        self.spectator_sids = set()
+        # Lifecycle state, see room_lifecycle.py
+        self.state = 'WAITING'
+        self.last_active_at = time.monotonic()
+
+    def tiles_left(self):
+        return len(self.wall) - self.draw_idx
+
+    def draw_tiles(self, n=1):
+        drawn_tiles = self.wall[self.draw_idx:self.draw_idx + n]
+        self.draw_idx += n
+        return drawn_tiles
+
 # TODO: leverage this when migrating to Redis(?), we can use the same methods from the socketio listeners, we'll just change the method implementation
 # Reasons for doing this (is this justifiable?):
 #   - We can implement an in-memory storage while the server is running
 #   - Easy migration to Redis
 #   - Separation of socketio logic from persistence logic
 class MahjongCacheClient:
-    def __init__(self):
-        self.rooms = defaultdict(lambda: {
-            'game_tiles': [],
-            'player_by_uuid': {},
-            'player_uuids': [],
-            'current_player_idx': 0,
-            'past_discarded_tiles': [],
-            'current_discarded_tile': None,
-            'messages': [],
-            'claimed_player_uuids': set(),
-            'human_player_count': 0,
-            'is_game_in_progress': False,
-        })
+    def __init__(self, chat_history_size=50):
+        # Rooms are only created through create_room and removed through delete_room
+        self.rooms = {}
+
+        # Chat history of the lobby, rooms keep their own history (see Room.messages)
+        self.chat_history_size = chat_history_size
+        self.lobby_messages = deque(maxlen=chat_history_size)
 
         # User uuid to room id map, useful for rejoining a game
         self.room_id_by_uuid = {}
 
-        # Rooms with < 4 players
-        self.open_room_ids = set()
+        # Index of connected players, sid to (room_id, player_uuid) and back. Handlers resolve the acting player
+        # through it instead of reading the Socket.IO session.
+        self.player_by_sid = {}
+        self.sid_by_player_uuid = {}
+
+        # Rooms with < 4 players that are open to matchmaking
+        self.matchmaker = Matchmaker()
 
         # Possible player states
         self.states = set([
@@ -48,13 +137,48 @@ class MahjongCacheClient:
         return self.rooms[room_id]
 
     def get_room_size(self, room_id):
-        return len(self.rooms[room_id]['player_uuids'])
+        room = self.rooms.get(room_id)
+        return len(room.player_uuids) if room else 0
 
-    # TODO: should solve for collisions?
     def generate_room_id(self):
-        chars = [c for c in string.ascii_letters + string.digits]
-        random.shuffle(chars)
-        return ''.join([random.choice(chars) for _ in range(8)])
+        """Returns a room id that isn't used by any existing room"""
+        while True:
+            room_id = ''.join(random.choices(ROOM_ID_CHARS, k=8))
+            if room_id not in self.rooms:
+                return room_id
+
+    def create_room(self):
+        """Creates an empty room that is open to matchmaking, returns its id"""
+        room_id = self.generate_room_id()
+        self.rooms[room_id] = Room(self.chat_history_size)
+        self.matchmaker.add_room(room_id)
+        return room_id
+
+    def delete_room(self, room_id):
+        """Removes the room and every reference to it, its players can join new rooms afterwards"""
+        room = self.rooms.pop(room_id)
+        for player_uuid in room.player_uuids:
+            if self.room_id_by_uuid.get(player_uuid) == room_id:
+                del self.room_id_by_uuid[player_uuid]
+            sid = self.sid_by_player_uuid.get(player_uuid)
+            if sid is not None and self.player_by_sid[sid][0] == room_id:
+                self.unindex_sid(sid)
+        self.matchmaker.remove_room(room_id)
+
+    def index_sid(self, sid, room_id, player_uuid):
+        """Maps the sid to the player, a player only acts through their most recent sid"""
+        old_sid = self.sid_by_player_uuid.get(player_uuid)
+        if old_sid is not None:
+            del self.player_by_sid[old_sid]
+        self.player_by_sid[sid] = (room_id, player_uuid)
+        self.sid_by_player_uuid[player_uuid] = sid
+
+    def unindex_sid(self, sid):
+        """Removes the sid from the index, returns the (room_id, player_uuid) it mapped to or None"""
+        entry = self.player_by_sid.pop(sid, None)
+        if entry is not None:
+            del self.sid_by_player_uuid[entry[1]]
+        return entry
 
     def search_for_room(self, player_uuid):
         if player_uuid in self.room_id_by_uuid:
@@ -62,35 +186,53 @@ class MahjongCacheClient:
             logger.info(f'Player player_uuid={player_uuid} is already in room_id={room_id}')
             return room_id
 
-        logger.info(f'open_rooms: {self.open_room_ids}')
-        for r_id in self.open_room_ids:
-            room_size = self.get_room_size(r_id)
-            if room_size < 4:
-                logger.info(f'Found available room_id={r_id}')
-                if room_size == 3:
-                    logger.info(f'Room has 3 players already, removing room_id={r_id} from open rooms set')
-                    self.open_room_ids.remove(r_id)
-                return r_id
+        room_id = self.matchmaker.find_room()
+        if room_id is not None:
+            logger.info(f'Found available room_id={room_id} out of {len(self.matchmaker)} open rooms')
+            return room_id
 
         # No available room found, creating new room for player
-        logger.info(f'No available rooms, creating new room for player_uuid={player_uuid}')
-        new_room_id = self.generate_room_id()
-        self.open_room_ids.add(new_room_id)
-        return new_room_id
+        room_id = self.create_room()
+        logger.info(f'No available rooms, created room_id={room_id} for player_uuid={player_uuid}')
+        return room_id
 
     def get_opponents(self, room_id, player_uuid):
         room = self.get_room(room_id)
-        player_idx = room['player_uuids'].index(player_uuid)
-        num_of_players = len(room['player_uuids'])
+        player_idx = room.player_uuids.index(player_uuid)
+        num_of_players = len(room.player_uuids)
         # Order opponent uuids in order of play
-        opponent_uuids = [room['player_uuids'][(player_idx + i) % num_of_players] for i in range(1, num_of_players)]
-        return [{
-            'name': room['player_by_uuid'][opponent_id]['username'],
-            'revealedMelds': room['player_by_uuid'][opponent_id]['revealedMelds'],
-            'tileCount': len(room['player_by_uuid'][opponent_id]['tiles']),
-            'concealedKongs': room['player_by_uuid'][opponent_id]['concealedKongs'],
-            'isCurrentTurn': room['player_by_uuid'][opponent_id]['currentState'] in { 'DRAW_TILE', 'DISCARD_TILE', 'REVEAL_MELD' },
-        } for opponent_id in opponent_uuids]
+        opponent_uuids = [room.player_uuids[(player_idx + i) % num_of_players] for i in range(1, num_of_players)]
+        return [self.get_public_player(room, opponent_id) for opponent_id in opponent_uuids]
+
+    def get_chat_history(self, room_id):
+        """Returns the message ring buffer for a room id or 'lobby', None for anything else (e.g. a sid)"""
+        if room_id == 'lobby':
+            return self.lobby_messages
+        room = self.rooms.get(room_id)
+        return room.messages if room else None
+
+    def get_public_player(self, room, player_uuid):
+        """Player data that other players and spectators can see, concealed tiles are only sent as a count"""
+        player = room.player_by_uuid[player_uuid]
+        return {
+            'name': player.username,
+            'revealedMelds': to_melds(player.revealed_melds),
+            'tileCount': len(player.tiles),
+            'concealedKongs': to_melds(player.concealed_kongs),
+            'isCurrentTurn': player.current_state in { 'DRAW_TILE', 'DISCARD_TILE', 'REVEAL_MELD' },
+        }
+
+    def get_public_state(self, room_id):
+        """Room state sent to spectators, players are in order of play"""
+        room = self.get_room(room_id)
+        return {
+            'players': [self.get_public_player(room, pid) for pid in room.player_uuids],
+            'discardedTile': to_tile(room.current_discarded_tile),
+            'pastDiscardedTiles': to_tiles(room.past_discarded_tiles),
+            'tilesLeft': room.tiles_left(),
+            'isGameInProgress': room.is_game_in_progress,
+            'isGameOver': any(room.player_by_uuid[pid].current_state in { 'WIN', 'DRAW' } for pid in room.player_uuids),
+        }
 
     def add_player(self, room_id, username, player_uuid, isAi=False):
         if player_uuid in self.room_id_by_uuid:
@@ -104,39 +246,45 @@ class MahjongCacheClient:
         room = self.get_room(room_id)
 
         # Initialize player data for uuid
-        room['player_by_uuid'][player_uuid] = {
-            'username': username,
-            'tiles': [],
-            'currentState': 'NO_ACTION',
-            'declareClaimStartTime': None,
-            'declaredMeldType': None,
-            'validMeldSubsets': None,
-            'revealedMelds': [],
-            'newMeld': [],
-            'concealedKongs': [],
-            'canDeclareKong': False,
-            'canDeclareWin': False,
-            'isHost': True if not room['player_uuids'] else False,
-            'isAi': isAi,
-        }
+        room.player_by_uuid[player_uuid] = Player(username, is_host=not room.player_uuids, is_ai=isAi)
 
         # Add uuid to list of active players
-        room['player_uuids'].append(player_uuid)
+        room.player_uuids.append(player_uuid)
+        self.matchmaker.take_seat(room_id)
 
         if not isAi:
-            room['human_player_count'] += 1
+            room.human_player_count += 1
+
+    def remove_player(self, room_id, player_uuid):
+        """Removes a player who left the room. Their seat is only freed if the game hasn't started yet,
+           a game in progress keeps the seat so the order of play doesn't change."""
+        del self.room_id_by_uuid[player_uuid]
+
+        room = self.get_room(room_id)
+        player = room.player_by_uuid[player_uuid]
+        if not player.is_ai:
+            room.human_player_count -= 1
+
+        if room.state != 'WAITING':
+            return
+
+        del room.player_by_uuid[player_uuid]
+        room.player_uuids.remove(player_uuid)
+        if player.is_host and room.player_uuids:
+            room.player_by_uuid[room.player_uuids[0]].is_host = True
+        self.matchmaker.add_room(room_id, self.matchmaker.seats_per_room - len(room.player_uuids))
 
     # TODO: generalize function to "set current player" essentially, can
     #       pass in optional parameter to set a specific player
     def point_to_next_player(self, room_id):
         room = self.get_room(room_id)
-        current_player_idx = room['current_player_idx']
-        current_player_uuid = room['player_uuids'][current_player_idx]
+        current_player_idx = room.current_player_idx
+        current_player_uuid = room.player_uuids[current_player_idx]
 
-        room['player_by_uuid'][current_player_uuid]['currentState'] = 'NO_ACTION'
+        room.player_by_uuid[current_player_uuid].current_state = 'NO_ACTION'
 
-        room['current_player_idx'] = current_player_idx = (current_player_idx + 1) % 4
-        current_player_uuid = room['player_uuids'][current_player_idx]
+        room.current_player_idx = current_player_idx = (current_player_idx + 1) % 4
+        current_player_uuid = room.player_uuids[current_player_idx]
 
         self.set_next_player(room_id, current_player_uuid, 'DRAW_TILE')
 
@@ -145,9 +293,8 @@ class MahjongCacheClient:
     def set_next_player(self, room_id, player_uuid, next_state):
         room = self.get_room(room_id)
 
-        room['current_player_idx'] = room['player_uuids'].index(player_uuid)
-        room['player_by_uuid'][player_uuid]['currentState'] = next_state
+        room.current_player_idx = room.player_uuids.index(player_uuid)
+        room.player_by_uuid[player_uuid].current_state = next_state
 
     def set_player_state(self, room_id, player_uuid, new_state):
-        self.rooms[room_id]['player_by_uuid'][player_uuid]['currentState'] = new_state
-
+        self.rooms[room_id].player_by_uuid[player_uuid].current_state = new_state
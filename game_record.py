@@ -0,0 +1,63 @@
+import json
+
+from mahjong_rules import MELD_CODES
+
+# Handlers whose calls change game state, in the order of their action codes
+ACTIONS = [
+    'start_game',
+    'draw_tile',
+    'end_turn',
+    'update_claim_state',
+    'complete_new_meld',
+    'declare_concealed_kong',
+    'declare_win',
+]
+ACTION_CODES = { action: code for code, action in enumerate(ACTIONS) }
+
+MELDS_BY_CODE = { code: meld for meld, code in MELD_CODES.items() }
+
+class GameRecord:
+    """Compact log of every state-changing action in a game, replaying it from the same wall seed reproduces the game.
+       Each action takes 3 + len(args) bytes in actions: action code, seat, number of args, args. Args are tile
+       indices for end_turn/complete_new_meld and a MELD_CODES value for update_claim_state."""
+    __slots__ = ('wall_seed', 'include_bonus', 'players', 'actions')
+
+    def __init__(self, wall_seed, include_bonus, players, actions=b''):
+        self.wall_seed = wall_seed
+        self.include_bonus = include_bonus
+        # List of (player_uuid, username, is_ai) in seat order
+        self.players = players
+        self.actions = bytearray(actions)
+
+    def add(self, action, seat, args=b''):
+        self.actions += bytes([ACTION_CODES[action], seat, len(args)])
+        self.actions += bytes(args)
+
+    def __iter__(self):
+        """Yields (action, seat, args) tuples"""
+        i = 0
+        while i < len(self.actions):
+            code, seat, num_of_args = self.actions[i:i + 3]
+            yield ACTIONS[code], seat, bytes(self.actions[i + 3:i + 3 + num_of_args])
+            i += 3 + num_of_args
+
+    def to_dict(self):
+        return {
+            'wallSeed': self.wall_seed,
+            'includeBonus': self.include_bonus,
+            'players': [list(p) for p in self.players],
+            'actions': self.actions.hex(),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['wallSeed'], d['includeBonus'], [tuple(p) for p in d['players']], bytes.fromhex(d['actions']))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
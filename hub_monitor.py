@@ -0,0 +1,77 @@
+import sys
+import time
+import traceback
+from collections import deque
+
+import eventlet.patcher
+
+import server_logger
+
+logger = server_logger.get()
+
+# The watchdog has to be a real OS thread that keeps running while the hub is blocked, even if the
+# standard library was monkey patched by the eventlet worker
+real_threading = eventlet.patcher.original('threading')
+real_time = eventlet.patcher.original('time')
+
+class HubMonitor:
+    """Measures event loop lag with a green task that sleeps interval_s and records how late it wakes up into
+       metrics.hub_lag. A watchdog thread notices when the task hasn't run for longer than block_threshold_s
+       and captures the stack of the hub's thread, which is the greenlet blocking everyone else."""
+    def __init__(self, metrics, interval_s, block_threshold_s, max_captures=10):
+        self.metrics = metrics
+        self.interval_s = interval_s
+        self.block_threshold_s = block_threshold_s
+        self.hub_thread_id = None
+        self.last_beat = time.monotonic()
+        self.beat_count = 0
+        # Written by the watchdog, logged from the hub once it's unblocked
+        self.pending_captures = deque(maxlen=max_captures)
+        self.recent_captures = deque(maxlen=max_captures)
+
+    def run(self, sleep):
+        """Green task measuring lag, starts the watchdog thread on first run"""
+        self.hub_thread_id = real_threading.get_ident()
+        real_threading.Thread(target=self.watch, name='hub-monitor', daemon=True).start()
+
+        while True:
+            start = time.monotonic()
+            sleep(self.interval_s)
+            self.beat()
+            self.metrics.hub_lag.record(max(0, self.last_beat - start - self.interval_s))
+            self.log_captures()
+
+    def beat(self):
+        self.last_beat = time.monotonic()
+        self.beat_count += 1
+
+    def watch(self):
+        captured_beat_count = None
+        while True:
+            real_time.sleep(self.block_threshold_s / 2)
+            blocked_s = time.monotonic() - self.last_beat - self.interval_s
+            # One capture per blocking stretch, the hub has to beat again before the next one
+            if blocked_s > self.block_threshold_s and captured_beat_count != self.beat_count:
+                captured_beat_count = self.beat_count
+                self.capture(blocked_s)
+
+    def capture(self, blocked_s):
+        frame = sys._current_frames().get(self.hub_thread_id)
+        if frame is None:
+            return
+        self.pending_captures.append((time.time(), blocked_s, ''.join(traceback.format_stack(frame))))
+
+    def log_captures(self):
+        while self.pending_captures:
+            capture = self.pending_captures.popleft()
+            captured_at, blocked_s, stack = capture
+            self.metrics.hub_blocked_count += 1
+            self.recent_captures.append(capture)
+            logger.warning(f'Event loop was blocked for at least {blocked_s * 1000:.0f}ms, stack of the blocking greenlet:\n{stack}')
+
+    def render_captures(self):
+        """Returns the recent captures as plain text, newest first"""
+        return '\n'.join(
+            f'# blocked for at least {blocked_s * 1000:.0f}ms at {time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(captured_at))}\n{stack}'
+            for captured_at, blocked_s, stack in reversed(self.recent_captures)
+        )
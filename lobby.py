@@ -0,0 +1,59 @@
+from collections import deque
+
+class LobbyPresence:
+    """Tracks who is in the lobby and collects arrivals, departures and renames until the next digest. The server
+       sends one digest per tick instead of broadcasting every change to the whole lobby as it happens."""
+    def __init__(self, max_names_per_digest=20):
+        self.username_by_sid = {}
+        # Only the most recent names are listed in a digest, the counts cover everyone
+        self.arrived = deque(maxlen=max_names_per_digest)
+        self.departed = deque(maxlen=max_names_per_digest)
+        self.renamed = deque(maxlen=max_names_per_digest)
+        self.arrived_count = 0
+        self.departed_count = 0
+        self.has_changes = False
+
+    def __len__(self):
+        return len(self.username_by_sid)
+
+    def join(self, sid, username):
+        self.username_by_sid[sid] = username
+        self.arrived.append(username)
+        self.arrived_count += 1
+        self.has_changes = True
+
+    def rename(self, sid, username):
+        old_username = self.username_by_sid.get(sid)
+        if old_username is None or old_username == username:
+            return
+        self.username_by_sid[sid] = username
+        self.renamed.append([old_username, username])
+        self.has_changes = True
+
+    def leave(self, sid):
+        username = self.username_by_sid.pop(sid, None)
+        if username is None:
+            return
+        self.departed.append(username)
+        self.departed_count += 1
+        self.has_changes = True
+
+    def pop_digest(self):
+        """Returns the changes since the last digest as an event payload, or None if nothing changed"""
+        if not self.has_changes:
+            return None
+
+        digest = {
+            'population': len(self.username_by_sid),
+            'arrived': list(self.arrived),
+            'arrivedCount': self.arrived_count,
+            'departed': list(self.departed),
+            'departedCount': self.departed_count,
+            'renamed': list(self.renamed),
+        }
+        self.arrived.clear()
+        self.departed.clear()
+        self.renamed.clear()
+        self.arrived_count = self.departed_count = 0
+        self.has_changes = False
+        return digest
@@ -1,8 +1,39 @@
 import copy
+import numpy as np
 from collections import defaultdict, Counter
 from operator import itemgetter
 
 from Constants import HONOR_SUITS, NUMERIC_SUITS, SETS_NEEDED_TO_WIN 
+from tiles import TILES, TILE_BY_KEY, TILE_KEYS, INDEX_BY_KEY, NUM_OF_TILE_KINDS, tile_index, get_tile_counts
+
+CLAIM_RANKS = {
+    'WIN': 3,
+    'PUNG': 2,
+    'KONG': 2,
+    'CHOW': 1,
+}
+
+# Index ranges of the 1-9 tiles for each numeric suit, tile indices are contiguous within a suit
+NUMERIC_SUIT_RANGES = [(INDEX_BY_KEY[(suit, 1)], INDEX_BY_KEY[(suit, 9)] + 1) for suit in sorted(NUMERIC_SUITS)]
+
+# Tiles that can only be melded as pungs/pairs
+NON_NUMERIC_INDICES = [idx for idx, key in enumerate(TILE_KEYS) if key[0] not in NUMERIC_SUITS]
+
+# For each tile index, the index pairs that would make a chow with that tile
+CHOW_NEIGHBORS = [[
+    (INDEX_BY_KEY[(t_suit, t_type + offsets[0])], INDEX_BY_KEY[(t_suit, t_type + offsets[1])])
+    for offsets in [(-2, -1), (-1, 1), (1, 2)]
+    if t_suit in NUMERIC_SUITS and all([1 <= t_type + o <= 9 for o in offsets])
+] for t_suit, t_type in TILE_KEYS]
+
+# Batched claim evaluation encodes declared melds as small ints, None means no claim
+MELD_CODES = { None: 0, 'CHOW': 1, 'PUNG': 2, 'KONG': 3, 'WIN': 4 }
+
+# CHOW_NEIGHBORS as a (tile index, 3 offsets, 2 tiles) array, missing neighbors point at the zero-padded column -1
+CHOW_NEIGHBOR_ARRAY = np.full((NUM_OF_TILE_KINDS, 3, 2), -1, dtype=np.intp)
+for idx, neighbors in enumerate(CHOW_NEIGHBORS):
+    if neighbors:
+        CHOW_NEIGHBOR_ARRAY[idx, :len(neighbors)] = neighbors
 
 def get_tile_for_kong(tiles):
     tile_counter = Counter()
@@ -12,43 +43,109 @@ def get_tile_for_kong(tiles):
 
     for k, v in tile_counter.items():
         if v == 4:
-            return { 'suit': k[0], 'type': k[1] }
+            return TILE_BY_KEY[k]
 
     return None
 
-def get_valid_tile_sets(tiles, discarded_tile, target_meld):
+def get_valid_tile_sets(tiles, discarded_tile, target_meld, counts=None):
     if target_meld == 'PUNG':
-        return [[{
-            'suit': discarded_tile['suit'],
-            'type': discarded_tile['type'],
-        } for _ in range(2)]]
+        return [[TILES[tile_index(discarded_tile)]] * 2]
     elif target_meld == 'KONG':
-        return [[{
-            'suit': discarded_tile['suit'],
-            'type': discarded_tile['type'],
-        } for _ in range(3)]]
+        return [[TILES[tile_index(discarded_tile)]] * 3]
     elif target_meld == 'CHOW':
-        return [[{'suit': tup[0], 'type': tup[1]} for tup in chow_subset] for chow_subset in get_valid_chow_subsets(tiles, discarded_tile)]
+        return [[TILE_BY_KEY[tup] for tup in chow_subset] for chow_subset in get_valid_chow_subsets(tiles, discarded_tile, counts)]
 
     return None
 
 def check_tiles_against_meld(tiles, discarded_tile, target_meld, revealed_melds_count, is_chow_allowed=True):
-    if target_meld == 'WIN':
-        tiles_with_discarded_tile = tiles + [discarded_tile]
-        target_set_count = SETS_NEEDED_TO_WIN - revealed_melds_count
-        if can_meld_concealed_hand(tiles_with_discarded_tile, target_set_count):
-            return 3
-    elif target_meld == 'PUNG':
-        if can_meld_pung(tiles, discarded_tile):
-            return 2
-    elif target_meld == 'KONG':
-        if can_meld_kong(tiles, discarded_tile):
-            return 2
-    elif target_meld == 'CHOW':
-        if is_chow_allowed and can_meld_chow(tiles, discarded_tile):
-            return 1
+    claim_table = get_claim_table(tiles, revealed_melds_count)
+    return rank_claim(claim_table, discarded_tile, target_meld, is_chow_allowed)
+
+def rank_claim(claim_table, discarded_tile, target_meld, is_chow_allowed=True):
+    """Returns the rank of a claim on the discarded tile, looked up from a claim table built by get_claim_table"""
+    if target_meld not in CLAIM_RANKS or (target_meld == 'CHOW' and not is_chow_allowed):
+        return 0
+    if claim_table[target_meld] & (1 << tile_index(discarded_tile)):
+        return CLAIM_RANKS[target_meld]
     return 0
 
+def rank_claims(claim_tables, discarded_tiles, target_melds, chow_allowed):
+    """Ranks a batch of claims with one call to get_claim_ranks, claim i is made with claim_tables[i] on discarded_tiles[i]"""
+    return rank_claims_by_index(claim_tables, [tile_index(t) for t in discarded_tiles], target_melds, chow_allowed)
+
+def rank_claims_by_index(claim_tables, discarded_tile_idxs, target_melds, chow_allowed):
+    if not claim_tables:
+        return []
+
+    ranks = get_claim_ranks(
+        np.array([ct['counts'] for ct in claim_tables], dtype=np.int8),
+        np.array(discarded_tile_idxs, dtype=np.intp),
+        np.array([MELD_CODES.get(m, 0) for m in target_melds], dtype=np.int8),
+        np.array([ct['WIN'] for ct in claim_tables], dtype=np.uint64),
+        np.array(chow_allowed, dtype=bool))
+    return ranks.tolist()
+
+def get_claim_ranks(hand_counts, discarded_idxs, meld_codes, win_bits, chow_allowed):
+    """Vectorized rank_claim. Row i of the (N, NUM_OF_TILE_KINDS) hand_counts matrix claims tile index discarded_idxs[i]
+       as meld_codes[i] (see MELD_CODES), win_bits[i] is that hand's WIN bitset from get_claim_table.
+       Returns an array of N claim ranks."""
+    rows = np.arange(len(discarded_idxs))
+    discarded_counts = hand_counts[rows, discarded_idxs]
+
+    # Append a zero column so the -1 entries of CHOW_NEIGHBOR_ARRAY are never held
+    padded_counts = np.concatenate([hand_counts, np.zeros((len(rows), 1), dtype=hand_counts.dtype)], axis=1)
+    held_neighbors = padded_counts[rows[:, None, None], CHOW_NEIGHBOR_ARRAY[discarded_idxs]] > 0
+
+    can_win = (np.right_shift(win_bits, discarded_idxs.astype(np.uint64)) & np.uint64(1)).astype(bool)
+    can_pung = discarded_counts >= 2
+    can_kong = discarded_counts >= 3
+    can_chow = held_neighbors.all(axis=2).any(axis=1) & chow_allowed
+
+    return np.select([
+        (meld_codes == MELD_CODES['WIN']) & can_win,
+        (meld_codes == MELD_CODES['PUNG']) & can_pung,
+        (meld_codes == MELD_CODES['KONG']) & can_kong,
+        (meld_codes == MELD_CODES['CHOW']) & can_chow,
+    ], [
+        CLAIM_RANKS['WIN'],
+        CLAIM_RANKS['PUNG'],
+        CLAIM_RANKS['KONG'],
+        CLAIM_RANKS['CHOW'],
+    ], default=0)
+
+def get_claim_table(tiles, revealed_melds_count):
+    return get_claim_table_from_counts(get_tile_counts(tiles), revealed_melds_count)
+
+def get_claim_table_from_counts(counts, revealed_melds_count):
+    """Precomputes bitsets of the tiles this hand could claim for each meld type, bit i is set if tile index i is claimable.
+       The table only depends on the hand, so it can be reused until the hand changes."""
+    target_set_count = SETS_NEEDED_TO_WIN - revealed_melds_count
+    claim_table = {
+        'counts': counts,
+        'PUNG': 0,
+        'KONG': 0,
+        'CHOW': 0,
+        'WIN': 0,
+    }
+
+    for idx, count in enumerate(counts):
+        bit = 1 << idx
+        if count >= 2:
+            claim_table['PUNG'] |= bit
+        if count >= 3:
+            claim_table['KONG'] |= bit
+        if any([counts[a] and counts[b] for a, b in CHOW_NEIGHBORS[idx]]):
+            claim_table['CHOW'] |= bit
+
+        # A winning discard has to complete a pair, pung or chow with tiles already in hand
+        if count < 4 and (count or claim_table['CHOW'] & bit):
+            counts[idx] += 1
+            if can_win_with_counts(counts, target_set_count):
+                claim_table['WIN'] |= bit
+            counts[idx] -= 1
+
+    return claim_table
+
 def can_meld_kong(tiles, discarded_tile):
     return len([t for t in tiles if t == discarded_tile]) >= 3
 
@@ -63,18 +160,48 @@ def can_meld_chow(tiles, discarded_tile):
     chow_subsets = get_valid_chow_subsets(tiles, discarded_tile)
     return len(chow_subsets) > 0
 
-def get_valid_chow_subsets(tiles, discarded_tile):
-    # Convert from list of dicts to set of tuples
-    tiles_set = {(t['suit'], t['type']) for t in tiles if t['suit'] in NUMERIC_SUITS}
+def get_valid_chow_subsets(tiles, discarded_tile, counts=None):
+    if counts is None:
+        counts = get_tile_counts(tiles)
+
+    # Gather all tile "pairs" that would result in a chow with the discarded tile
+    return [{TILE_KEYS[a], TILE_KEYS[b]} for a, b in CHOW_NEIGHBORS[tile_index(discarded_tile)] if counts[a] and counts[b]]
+
+def can_win_with_counts(counts, target_set_count=4):
+    """Counts-based win check, same rules as can_meld_concealed_hand but takes a list of tile counts indexed by tile index"""
+    if sum(counts) != 3 * target_set_count + 2:
+        return False
+
+    # Try each candidate pair, the remaining tiles must all resolve into sets
+    for pair_idx in range(NUM_OF_TILE_KINDS):
+        if counts[pair_idx] < 2:
+            continue
+        counts[pair_idx] -= 2
+        is_winning_hand = can_meld_sets(counts)
+        counts[pair_idx] += 2
+        if is_winning_hand:
+            return True
+
+    return False
+
+def can_meld_sets(counts):
+    """Returns True if the tile counts resolve completely into pungs and chows"""
+    for idx in NON_NUMERIC_INDICES:
+        if counts[idx] not in {0, 3}:
+            return False
 
-    # Generate all tile "pairs" that would result in a chow with the discarded tile
-    return [tiles_subset for tiles_subset in get_all_chow_subsets(discarded_tile) if tiles_subset <= tiles_set]
+    for start, end in NUMERIC_SUIT_RANGES:
+        # Walk the suit from lowest to highest, leftover copies of the lowest tile after taking pungs must start chows
+        remaining = counts[start:end] + [0, 0]
+        for i in range(9):
+            leftover = remaining[i] % 3
+            if leftover:
+                if remaining[i + 1] < leftover or remaining[i + 2] < leftover:
+                    return False
+                remaining[i + 1] -= leftover
+                remaining[i + 2] -= leftover
 
-def get_all_chow_subsets(tile):
-    for offsets in [(-2, -1), (-1, 1), (1, 2)]:
-        res = {(tile['suit'], tile['type'] + o) for o in offsets}
-        if all([1 <= r[1] <= 9 for r in res]):
-            yield res
+    return True
 
 def can_meld_concealed_hand(tiles, target_set_count=4):
     """Returns True if the given tiles can make the desired number of melds. This ignores special mahjong hands."""
@@ -239,25 +366,19 @@ def get_melds(tiles, num_of_target_melds, num_of_target_pairs = 1):
     for t_key, t_cnt in honor_counter.items():
         if t_cnt == 3:
             num_of_target_melds -= 1
-            melds.append([{
-                'suit': t_key[0],
-                'type': t_key[1],
-            } for i in range(t_cnt)])
+            melds.append([TILE_BY_KEY[t_key]] * t_cnt)
         elif t_cnt == 2:
             num_of_target_pairs -= 1
-            pair = [{
-                'suit': t_key[0],
-                'type': t_key[1],
-            } for i in range(t_cnt)]
+            pair = [TILE_BY_KEY[t_key]] * t_cnt
 
     # Compile all possible winning hands from numeric tiles
     answers = make_melds(sorted(numeric_counter.items(), key=itemgetter(0, 1)), num_of_target_pairs)
 
     print(f'Found {len(answers)} possible winning hands')
 
-    # Pick first answer and convert to dict items
+    # Pick first answer and convert to tile dicts
     # TODO: fix this to pick highest hand once point system is introduced
-    melds += [[{ 'suit': tup[0], 'type': tup[1] } for tup in meld] for meld in answers[0]]
+    melds += [[TILE_BY_KEY[tup] for tup in meld] for meld in answers[0]]
 
     # If pair was produced from honor tiles, add it
     if pair:
@@ -278,13 +399,13 @@ def make_melds(tiles, pairs_left, current_ans=[]):
         print('trying pair', t)
         if t[1] >= 2:
             print('found pair, adding to current_ans')
-            tiles_prime = [tuple(t[0], t[1] - 2)] + tiles[1:] if t[1] > 2 else tiles[1:]
+            tiles_prime = [(t[0], t[1] - 2)] + tiles[1:] if t[1] > 2 else tiles[1:]
             ans += make_melds(tiles_prime, pairs_left - 1, current_ans + [[t[0] for i in range(2)]])
 
     print('trying pung', t)
     if t[1] >= 3:
         print('found pung, adding to current_ans')
-        tiles_prime = [tuple(t[0], t[1] - 3)] + tiles[1:] if t[1] > 3 else tiles[1:]
+        tiles_prime = [(t[0], t[1] - 3)] + tiles[1:] if t[1] > 3 else tiles[1:]
         ans += make_melds(tiles_prime, pairs_left, current_ans + [[t[0] for i in range(3)]])
 
     if len(tiles) >= 3:
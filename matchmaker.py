@@ -0,0 +1,41 @@
+class Matchmaker:
+    """Tracks rooms that are open to matchmaking, bucketed by their number of open seats. Finding a room and taking
+       a seat are O(1), no matter how many rooms are open. Rooms with the fewest open seats are filled first so
+       partially filled rooms get to start their game before new rooms are opened."""
+    def __init__(self, seats_per_room=4):
+        self.seats_per_room = seats_per_room
+        # buckets[n] holds ids of rooms with n open seats, dicts are used as insertion-ordered sets
+        self.buckets = [{} for _ in range(seats_per_room + 1)]
+        self.open_seats_by_room_id = {}
+
+    def __len__(self):
+        return len(self.open_seats_by_room_id)
+
+    def __contains__(self, room_id):
+        return room_id in self.open_seats_by_room_id
+
+    def add_room(self, room_id, open_seats=None):
+        """Opens a room to matchmaking, a new room has every seat open"""
+        self.remove_room(room_id)
+        if open_seats is None:
+            open_seats = self.seats_per_room
+        if open_seats > 0:
+            self.buckets[open_seats][room_id] = None
+            self.open_seats_by_room_id[room_id] = open_seats
+
+    def remove_room(self, room_id):
+        open_seats = self.open_seats_by_room_id.pop(room_id, None)
+        if open_seats is not None:
+            del self.buckets[open_seats][room_id]
+
+    def take_seat(self, room_id):
+        """Marks a seat as taken, the room leaves matchmaking once it is full. Rooms not open to matchmaking are ignored."""
+        if room_id in self.open_seats_by_room_id:
+            self.add_room(room_id, self.open_seats_by_room_id[room_id] - 1)
+
+    def find_room(self):
+        """Returns the id of the open room with the fewest open seats, or None if no room is open"""
+        for bucket in self.buckets[1:]:
+            if bucket:
+                return next(iter(bucket))
+        return None
@@ -0,0 +1,109 @@
+import bisect
+import time
+from collections import Counter
+
+# Upper bounds in seconds of the latency buckets, doubling from 50us to ~13s
+LATENCY_BUCKETS_S = tuple(0.00005 * 2 ** i for i in range(19))
+
+class Histogram:
+    """Fixed-bucket histogram, recording a value is a bisect and an increment. Percentiles are estimated
+       as the upper bound of the bucket they fall into."""
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS_S):
+        self.bounds = bounds
+        # Last bucket counts values above the largest bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q):
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[idx] if idx < len(self.bounds) else float('inf')
+        return float('inf')
+
+def render_histogram(lines, name, labels, histogram):
+    """Appends a histogram in seconds to lines, with p50 and p99 estimates as a separate quantile metric"""
+    sep = ',' if labels else ''
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_seconds_bucket{{{labels}{sep}le="{bound:g}"}} {cumulative}')
+    lines.append(f'{name}_seconds_bucket{{{labels}{sep}le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+    lines.append(f'{name}_seconds_count{{{labels}}} {histogram.count}')
+    for q in (0.5, 0.99):
+        lines.append(f'{name}_quantile_seconds{{{labels}{sep}quantile="{q}"}} {histogram.percentile(q):g}')
+
+class Metrics:
+    """Counters and histograms for the server, rendered in the Prometheus text format by render()"""
+    def __init__(self):
+        self.latency_by_event = {}
+        self.handled_count_by_event = Counter()
+        self.emit_count_by_event = Counter()
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        # Recorded by hub_monitor.HubMonitor
+        self.hub_lag = Histogram()
+        self.hub_blocked_count = 0
+        self.started_at = time.monotonic()
+
+    def observe_handler(self, event, seconds):
+        histogram = self.latency_by_event.get(event)
+        if histogram is None:
+            histogram = self.latency_by_event[event] = Histogram()
+        histogram.record(seconds)
+        self.handled_count_by_event[event] += 1
+
+    def instrument(self, sio):
+        """Counts emits per event on sio, and packets and bytes handed to its engine.io server.
+           Emits to a room count once, bytes count once per recipient."""
+        emit = sio.emit
+        send = sio.eio.send
+
+        def counting_emit(event, *args, **kwargs):
+            self.emit_count_by_event[event] += 1
+            return emit(event, *args, **kwargs)
+
+        def counting_send(sid, data, *args, **kwargs):
+            self.packets_sent += 1
+            self.bytes_sent += len(data)
+            return send(sid, data, *args, **kwargs)
+
+        sio.emit = counting_emit
+        sio.eio.send = counting_send
+
+    def render(self, gauges):
+        """Returns the metrics as Prometheus text, gauges is a dict of metric name to value
+           (or to a dict of label string to value) sampled by the caller"""
+        lines = [f'mahjong_uptime_seconds {time.monotonic() - self.started_at:.3f}']
+
+        for name, value in gauges.items():
+            if isinstance(value, dict):
+                lines.extend(f'{name}{{{labels}}} {v}' for labels, v in value.items())
+            else:
+                lines.append(f'{name} {value}')
+
+        lines.append('# TYPE mahjong_handler_latency_seconds histogram')
+        for event, histogram in sorted(self.latency_by_event.items()):
+            render_histogram(lines, 'mahjong_handler_latency', f'event="{event}"', histogram)
+
+        lines.append('# TYPE mahjong_hub_lag_seconds histogram')
+        render_histogram(lines, 'mahjong_hub_lag', '', self.hub_lag)
+        lines.append(f'mahjong_hub_blocked_total {self.hub_blocked_count}')
+
+        lines.extend(f'mahjong_emits_total{{event="{event}"}} {count}' for event, count in sorted(self.emit_count_by_event.items()))
+        lines.append(f'mahjong_packets_sent_total {self.packets_sent}')
+        lines.append(f'mahjong_bytes_sent_total {self.bytes_sent}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,45 @@
+import time
+
+class PresenceTracker:
+    """Tracks since when players have been away. The server marks a player as away once their sid disconnects
+       (sids are resolved through the cache's sid index), or once a player who sends heartbeats misses them for
+       heartbeat_timeout_s. Players away for longer than grace_period_s are reported by get_absent_player_uuids."""
+    def __init__(self, grace_period_s, heartbeat_timeout_s):
+        self.grace_period_s = grace_period_s
+        self.heartbeat_timeout_s = heartbeat_timeout_s
+        # Only players who sent at least one heartbeat are expected to keep sending them
+        self.last_heartbeat_by_player_uuid = {}
+        self.away_since_by_player_uuid = {}
+
+    def present(self, player_uuid):
+        """Player (re)connected, a player who was away is present again"""
+        self.away_since_by_player_uuid.pop(player_uuid, None)
+        self.last_heartbeat_by_player_uuid.pop(player_uuid, None)
+
+    def heartbeat(self, player_uuid):
+        self.last_heartbeat_by_player_uuid[player_uuid] = time.monotonic()
+
+    def away(self, player_uuid, away_since=None):
+        self.last_heartbeat_by_player_uuid.pop(player_uuid, None)
+        self.away_since_by_player_uuid[player_uuid] = away_since or time.monotonic()
+
+    def remove_player(self, player_uuid):
+        """Forgets the player, used once they left their room"""
+        self.last_heartbeat_by_player_uuid.pop(player_uuid, None)
+        self.away_since_by_player_uuid.pop(player_uuid, None)
+
+    def get_absent_player_uuids(self):
+        """Returns players who have been away for longer than the grace period, each player is only returned once"""
+        now = time.monotonic()
+        for player_uuid, last_heartbeat in list(self.last_heartbeat_by_player_uuid.items()):
+            if now - last_heartbeat > self.heartbeat_timeout_s:
+                self.away(player_uuid, away_since=last_heartbeat)
+
+        absent_player_uuids = [
+            player_uuid
+            for player_uuid, away_since in self.away_since_by_player_uuid.items()
+            if now - away_since > self.grace_period_s
+        ]
+        for player_uuid in absent_player_uuids:
+            del self.away_since_by_player_uuid[player_uuid]
+        return absent_player_uuids
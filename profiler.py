@@ -0,0 +1,62 @@
+import os
+import sys
+from collections import Counter
+
+import eventlet.patcher
+
+# Samples are taken from a real OS thread, so it keeps sampling while the hub's thread is busy
+real_threading = eventlet.patcher.original('threading')
+
+class SamplingProfiler:
+    """Time-boxed sampling profiler for the running server. While profile() sleeps, a thread reads the stack of the
+       hub's thread every interval_s and counts it, nothing is hooked into the profiled code so the overhead stays
+       at one stack walk per sample. Only one profile runs at a time."""
+    def __init__(self, interval_s):
+        self.interval_s = interval_s
+        self.running = False
+
+    def profile(self, duration_s, sleep, function_name=None):
+        """Samples the calling thread for duration_s, sleep has to yield to the other greenlets. If function_name is
+           given only stacks with that function on them are counted, e.g. a handler. Returns the folded stacks as
+           text, or None if another profile is running."""
+        if self.running:
+            return None
+        self.running = True
+
+        thread_id = real_threading.get_ident()
+        stop = real_threading.Event()
+        count_by_stack = Counter()
+        sample_count = 0
+
+        def sample():
+            nonlocal sample_count
+            while not stop.wait(self.interval_s):
+                frame = sys._current_frames().get(thread_id)
+                if frame is None:
+                    continue
+                sample_count += 1
+
+                stack = []
+                matched = function_name is None
+                while frame is not None:
+                    code = frame.f_code
+                    matched = matched or code.co_name == function_name
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                if matched:
+                    count_by_stack[';'.join(reversed(stack))] += 1
+
+        sampler = real_threading.Thread(target=sample, name='sampling-profiler', daemon=True)
+        sampler.start()
+        try:
+            sleep(duration_s)
+        finally:
+            stop.set()
+            sampler.join()
+            self.running = False
+
+        header = f'# {sample_count} samples over {duration_s}s every {self.interval_s * 1000:g}ms'
+        if function_name is not None:
+            header += f', {sum(count_by_stack.values())} with function={function_name} on the stack'
+        # Folded stacks, one "frame;frame;frame count" line per stack, most sampled first
+        return '\n'.join([header] + [f'{stack} {count}' for stack, count in count_by_stack.most_common()]) + '\n'
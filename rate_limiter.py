@@ -0,0 +1,50 @@
+import time
+from collections import Counter
+
+class RateLimiter:
+    """Token buckets per sid and event type. Each bucket holds up to burst tokens and refills at rate_per_s,
+       an event is allowed if a token can be taken. Events without their own limit share default_limit's rates,
+       but still get a bucket per event type so spamming one event doesn't block the others."""
+    def __init__(self, default_limit, limit_by_event=None):
+        # Limits are (rate_per_s, burst) tuples
+        self.default_limit = default_limit
+        self.limit_by_event = limit_by_event or {}
+        # sid -> event -> [tokens, last refill time, whether the sid was told it is limited]
+        self.buckets_by_sid = {}
+        # Tools that call handlers directly (replay.py) turn limiting off
+        self.enabled = True
+        self.allowed_count = 0
+        self.limited_count_by_event = Counter()
+
+    def allow(self, sid, event):
+        """Takes a token from the sid's bucket for the event. Returns (allowed, first_limited), first_limited
+           is True for the first rejected event after the sid was last allowed, so callers can notify once."""
+        if not self.enabled:
+            return True, False
+
+        now = time.monotonic()
+        rate_per_s, burst = self.limit_by_event.get(event, self.default_limit)
+
+        buckets = self.buckets_by_sid.get(sid)
+        if buckets is None:
+            buckets = self.buckets_by_sid[sid] = {}
+        bucket = buckets.get(event)
+        if bucket is None:
+            bucket = buckets[event] = [burst, now, False]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate_per_s)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            bucket[2] = False
+            self.allowed_count += 1
+            return True, False
+
+        self.limited_count_by_event[event] += 1
+        first_limited = not bucket[2]
+        bucket[2] = True
+        return False, first_limited
+
+    def remove(self, sid):
+        self.buckets_by_sid.pop(sid, None)
@@ -0,0 +1,103 @@
+"""Replays a game record saved by the server (see GAME_RECORD_DIR) against the real event handlers.
+
+Usage: python replay.py <record.json> [--repeat N] [--profile]
+
+The handlers run in-process against a fake Socket.IO server, so a replay exercises the same game logic as a live game
+without any clients or network. --repeat replays the game N times and reports the time per game, --profile runs the
+replays under cProfile.
+"""
+import argparse
+import cProfile
+import logging
+import pstats
+import time
+
+import server
+from cacheclient import MahjongCacheClient
+from game_record import GameRecord, MELDS_BY_CODE
+from tiles import to_tile, to_tiles
+from util.fake_sio import FakeServer
+from wall_factory import WallFactory
+
+def get_sid(seat):
+    return f'replay-sid-{seat}'
+
+def setup_game(record):
+    """Resets server state and seats the recorded players, returns the room"""
+    server.sio = FakeServer()
+    server.cache = MahjongCacheClient()
+    server.wall_factory = WallFactory(record.include_bonus, 0)
+    server.config['claim_batch_interval_ms'] = 0
+    server.config['game_record_dir'] = ''
+    server.rate_limiter.enabled = False
+
+    room_id = server.cache.create_room()
+
+    for seat, (player_uuid, username, is_ai) in enumerate(record.players):
+        server.cache.add_player(room_id, username, player_uuid, isAi=is_ai)
+        server.save_session_data(get_sid(seat), player_uuid, room_id)
+
+    room = server.cache.get_room(room_id)
+    room.wall_seed = record.wall_seed
+    return room
+
+def run_action(action, sid, args):
+    if action == 'start_game':
+        server.start_game(sid)
+    elif action == 'draw_tile':
+        server.draw_tile(sid)
+    elif action == 'end_turn':
+        server.end_turn(sid, { 'discarded_tile': to_tile(args[0]) })
+    elif action == 'update_claim_state':
+        server.update_claim_state(sid, { 'declared_meld': MELDS_BY_CODE[args[0]] })
+    elif action == 'complete_new_meld':
+        server.complete_new_meld(sid, { 'new_meld': to_tiles(args) })
+    elif action == 'declare_concealed_kong':
+        server.declare_concealed_kong(sid)
+    elif action == 'declare_win':
+        server.declare_win(sid)
+
+def replay(record):
+    """Replays every action in the record, returns the room the game was replayed in"""
+    room = setup_game(record)
+    for action, seat, args in record:
+        run_action(action, get_sid(seat), args)
+    return room
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded mahjong game')
+    parser.add_argument('record')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--profile', action='store_true')
+    args = parser.parse_args()
+
+    record = GameRecord.load(args.record)
+
+    # Handlers log every step, keep it out of the measurements
+    logging.disable(logging.CRITICAL)
+
+    profiler = cProfile.Profile() if args.profile else None
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    for _ in range(args.repeat):
+        room = replay(record)
+    if profiler:
+        profiler.disable()
+    elapsed = time.perf_counter() - start
+
+    logging.disable(logging.NOTSET)
+
+    if room.record is None or room.record.actions != record.actions:
+        print('Replay diverged from the recorded game')
+        exit(1)
+
+    states = { room.player_by_uuid[pid].username: room.player_by_uuid[pid].current_state for pid in room.player_uuids }
+    print(f'Replayed {len(record.actions)} bytes of actions {args.repeat} time(s), {elapsed / args.repeat * 1000:.2f}ms per game')
+    print(f'Final states: {states}')
+
+    if profiler:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(30)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+import time
+
+# Rooms start WAITING for players, move to IN_PROGRESS once the host starts the game, and to FINISHED on a win or draw
+ROOM_STATES = ('WAITING', 'IN_PROGRESS', 'FINISHED')
+
+class RoomLifecycle:
+    """Decides when a room can be evicted from memory. Finished rooms are kept for finished_ttl_s so players can
+       still look at the final hands, any other room is evicted once nobody has acted in it for idle_ttl_s
+       (every player left or disconnected)."""
+    def __init__(self, idle_ttl_s, finished_ttl_s):
+        self.idle_ttl_s = idle_ttl_s
+        self.finished_ttl_s = finished_ttl_s
+
+    @staticmethod
+    def touch(room):
+        room.last_active_at = time.monotonic()
+
+    @staticmethod
+    def set_state(room, state):
+        room.state = state
+        room.last_active_at = time.monotonic()
+
+    def is_expired(self, room, now):
+        ttl_s = self.finished_ttl_s if room.state == 'FINISHED' else self.idle_ttl_s
+        return now - room.last_active_at > ttl_s
+
+    def get_expired_room_ids(self, rooms):
+        now = time.monotonic()
+        return [room_id for room_id, room in rooms.items() if self.is_expired(room, now)]
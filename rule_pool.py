@@ -0,0 +1,30 @@
+from eventlet import tpool
+
+class RulePool:
+    """Runs rule evaluations on eventlet's pool of native threads, the calling greenlet waits while every other
+       greenlet keeps running. Cheap calls run inline, as do all calls once max_pending evaluations are waiting,
+       so a burst of heavy evaluations can't grow an unbounded queue. max_pending=0 runs everything inline."""
+    def __init__(self, max_pending, num_threads=None):
+        self.max_pending = max_pending
+        if num_threads:
+            tpool.set_num_threads(num_threads)
+        self.pending = 0
+        self.offloaded_count = 0
+        self.inline_count = 0
+        self.overflow_count = 0
+
+    def call(self, func, *args, inline=False):
+        """Returns func(*args). Callers pass inline=True for calls known to be cheap, and have to expect that game
+           state may change while an offloaded call runs."""
+        if inline or self.pending >= self.max_pending:
+            if not inline and self.max_pending:
+                self.overflow_count += 1
+            self.inline_count += 1
+            return func(*args)
+
+        self.pending += 1
+        self.offloaded_count += 1
+        try:
+            return tpool.execute(func, *args)
+        finally:
+            self.pending -= 1